@@ -6,166 +6,349 @@ Detecta enlaces, descarga con yt-dlp y envía archivos o publica online.
 
 import discord
 import asyncio
+import atexit
 import subprocess
+import aiohttp
+import ipaddress
 import os
 import re
 import json
 import time
-import random
-import threading
-from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import secrets
+import signal
+import socket
+import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from aiohttp import web
 from dotenv import load_dotenv
 
 # Importar utilidades
-from utils import log, format_size, cleanup_file, get_temp_path, ensure_temp_dir
+from utils import MsgType, log as write_log, format_size, cleanup_file, get_temp_path, ensure_temp_dir
 
 # Cargar variables de entorno
 load_dotenv()
 
 # ==================== CONSTANTES ====================
 TIMEOUT_SECONDS = 300
+KILL_WAIT_SECONDS = 5  # Espera máxima tras matar yt-dlp por timeout
+STDERR_TAIL_LINES = 200  # Líneas de stderr de yt-dlp que se conservan
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '4'))
 MAX_ATTACHMENT_BYTES = 15_728_640  # 15 MB exactos
 FILE_RETENTION_SECONDS = 3600  # 1 hora
+MAX_SERVED_BYTES = 2_147_483_648  # 2 GB en disco para archivos publicados
+PUBLIC_IP_URL = "https://api.ipify.org"
+PUBLIC_IP_TTL_SECONDS = 300  # 5 minutos
+PUBLIC_IP_RETRY_SECONDS = 30  # Tiempo que se usa localhost si la consulta falla
+DISK_WORKERS = 8  # Hilos para operaciones de disco (asyncio.to_thread)
+
+# Content-Type por extensión de los archivos publicados
+CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.mkv': 'video/x-matroska'
+}
+
+# Patrón para detectar URLs (compilado una sola vez)
+URL_PATTERN = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+')
 
 # ==================== VARIABLES GLOBALES ====================
-download_lock = asyncio.Lock()
-active_servers = {}  # {port: server_instance}
-server_threads = {}  # {port: thread}
+download_sem = None  # asyncio.Semaphore, se crea en run_bot dentro del event loop
+active_users = set()  # {user_id} con una descarga en curso
+served_files = OrderedDict()  # {token: {"path", "filename", "size", "headers", "handle"}}, el más antiguo primero
+served_bytes = 0  # Suma de tamaños en served_files
+file_runner = None  # AppRunner del servidor de archivos
+server_port = None
+http_session = None  # aiohttp.ClientSession compartida
+public_ip = None
+public_ip_expires = 0.0
 
 # ==================== CLIENTE DISCORD ====================
 intents = discord.Intents.default()
 intents.message_content = True
 client = discord.Client(intents=intents)
 
+# ==================== LOGGING ====================
+def log(message_type, data=None):
+    """
+    Registra un evento de log
+    utils.log solo formatea y deja la línea en su buffer (la escribe su hilo
+    de volcado), así que se llama directamente desde el event loop
+    
+    Args:
+        message_type: Tipo de mensaje
+        data: Diccionario con datos adicionales
+    """
+    try:
+        write_log(message_type, data)
+    except Exception as e:
+        # Un evento mal formado no debe interrumpir la descarga
+        print(f"❌ Error al escribir log ({message_type!r}): {e}", file=sys.stderr)
+
 # ==================== SERVIDOR HTTP ====================
-class CustomHandler(SimpleHTTPRequestHandler):
-    """Handler personalizado para servir archivos"""
+async def handle_file(request):
+    """Sirve un archivo publicado a partir de su token"""
+    entry = served_files.get(request.match_info['token'])
+    filename = request.match_info['filename']
     
-    def __init__(self, *args, file_path=None, **kwargs):
-        self.file_path = file_path
-        super().__init__(*args, **kwargs)
+    if not entry or entry["filename"] != filename:
+        raise web.HTTPNotFound(text="Archivo no encontrado")
     
-    def do_GET(self):
-        """Maneja peticiones GET"""
-        try:
-            # Servir solo el archivo específico
-            if self.file_path and os.path.exists(self.file_path):
-                self.send_response(200)
-                
-                # Detectar content-type
-                filename = os.path.basename(self.file_path)
-                if filename.endswith('.mp4'):
-                    self.send_header('Content-type', 'video/mp4')
-                elif filename.endswith('.webm'):
-                    self.send_header('Content-type', 'video/webm')
-                elif filename.endswith('.mkv'):
-                    self.send_header('Content-type', 'video/x-matroska')
-                else:
-                    self.send_header('Content-type', 'application/octet-stream')
-                
-                self.send_header('Content-Disposition', f'inline; filename="{filename}"')
-                self.send_header('Content-Length', str(os.path.getsize(self.file_path)))
-                self.end_headers()
-                
-                # Enviar archivo
-                with open(self.file_path, 'rb') as f:
-                    self.wfile.write(f.read())
-            else:
-                self.send_error(404, "Archivo no encontrado")
-        except Exception as e:
-            self.send_error(500, f"Error: {str(e)}")
-    
-    def log_message(self, format, *args):
-        """Silenciar logs del servidor HTTP"""
-        pass
-
-def create_server(file_path, port):
-    """
-    Crea servidor HTTP para servir archivo
+    # FileResponse envía el archivo con loop.sendfile()
+    return web.FileResponse(entry["path"], headers=entry["headers"])
+
+def create_listener(port):
+    """
+    Crea el socket de escucha del servidor de archivos
     
     Args:
-        file_path: Ruta al archivo a servir
-        port: Puerto para el servidor
+        port: Puerto a usar (0 para que el sistema asigne uno libre)
     Returns:
-        Instancia del servidor
+        Socket enlazado
     """
-    handler = lambda *args, **kwargs: CustomHandler(*args, file_path=file_path, **kwargs)
-    server = ThreadingHTTPServer(('', port), handler)
-    return server
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # En Windows SO_REUSEADDR permite enlazar un puerto que ya escucha otro proceso
+    if os.name != 'nt':
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(('', port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
 
-def start_file_server(file_path, port):
+async def start_file_server():
     """
-    Inicia servidor en thread separado
+    Inicia el servidor HTTP de archivos sobre el event loop del bot
     
-    Args:
-        file_path: Ruta al archivo
-        port: Puerto del servidor
     Returns:
         True si se inició correctamente
     """
+    global file_runner, server_port
+    
+    # Determinar puerto (auto: lo asigna el sistema en un solo bind)
+    port_config = os.getenv('SERVE_PORT', 'auto')
+    port = 0 if port_config.lower() == 'auto' else int(port_config)
+    
+    app = web.Application()
+    app.router.add_get('/{token}/{filename}', handle_file)
+    runner = web.AppRunner(app, access_log=None)
+    
     try:
-        server = create_server(file_path, port)
-        active_servers[port] = server
-        
-        def serve():
-            server.serve_forever()
-        
-        thread = threading.Thread(target=serve, daemon=True)
-        thread.start()
-        server_threads[port] = thread
-        
-        return True
+        sock = create_listener(port)
+    except OSError as e:
+        log(MsgType.ERROR, {"code": "103", "message": "No se pudo iniciar servidor", "details": str(e)})
+        return False
+    
+    try:
+        await runner.setup()
+        await web.SockSite(runner, sock).start()
     except Exception as e:
-        log("error", {"code": "103", "message": "No se pudo iniciar servidor", "details": str(e)})
+        await runner.cleanup()
+        sock.close()
+        log(MsgType.ERROR, {"code": "103", "message": "No se pudo iniciar servidor", "details": str(e)})
         return False
+    
+    file_runner = runner
+    server_port = sock.getsockname()[1]
+    return True
 
-def stop_file_server(port):
+def publish_file(file_path, file_size):
     """
-    Detiene servidor HTTP
+    Registra archivo en el servidor bajo un token aleatorio y programa su
+    expiración. Si se supera MAX_SERVED_BYTES se eliminan antes de tiempo
+    los archivos publicados más antiguos.
     
     Args:
-        port: Puerto del servidor a detener
+        file_path: Ruta al archivo a servir
+        file_size: Tamaño del archivo en bytes
+    Returns:
+        Token con el que se accede al archivo
     """
+    global served_bytes
+    
+    token = secrets.token_urlsafe(16)
+    filename = os.path.basename(file_path)
+    
+    # Cabeceras calculadas una vez por archivo, no en cada petición
+    headers = {
+        'Content-Type': CONTENT_TYPES.get(os.path.splitext(filename)[1], 'application/octet-stream'),
+        'Content-Disposition': f'inline; filename="{filename}"'
+    }
+    
+    served_files[token] = {
+        "path": file_path,
+        "filename": filename,
+        "size": file_size,
+        "headers": headers,
+        "handle": schedule_cleanup(file_path, token, FILE_RETENTION_SECONDS)
+    }
+    served_bytes += file_size
+    
+    # Desalojar los más antiguos (nunca el recién publicado)
+    while served_bytes > MAX_SERVED_BYTES and len(served_files) > 1:
+        oldest = next(iter(served_files))
+        expire_file(served_files[oldest]["path"], oldest)
+    
+    return token
+
+def unpublish_file(token):
+    """
+    Retira archivo del servidor y cancela su limpieza programada
+    
+    Args:
+        token: Token devuelto por publish_file
+    """
+    global served_bytes
+    
+    entry = served_files.pop(token, None)
+    if entry:
+        served_bytes -= entry["size"]
+        entry["handle"].cancel()
+
+async def get_public_ip():
+    """
+    Obtiene IP pública consultando PUBLIC_IP_URL con la sesión HTTP compartida
+    El resultado se cachea PUBLIC_IP_TTL_SECONDS; si falla o la respuesta no
+    es una IP se usa localhost durante PUBLIC_IP_RETRY_SECONDS
+    """
+    global public_ip, public_ip_expires
+    
+    if public_ip and time.monotonic() < public_ip_expires:
+        return public_ip
+    
+    if http_session is None:
+        return "localhost"
+    
     try:
-        if port in active_servers:
-            active_servers[port].shutdown()
-            del active_servers[port]
-            log("server_shutdown", {"port": port})
-    except Exception as e:
-        print(f"Error al detener servidor: {e}")
+        async with http_session.get(PUBLIC_IP_URL) as response:
+            response.raise_for_status()
+            address = ipaddress.ip_address((await response.text()).strip())
+        ip = f"[{address}]" if address.version == 6 else str(address)
+        ttl = PUBLIC_IP_TTL_SECONDS
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        # Sin respuesta válida (p. ej. portal cautivo): no reintentar en cada publicación
+        ip = "localhost"
+        ttl = PUBLIC_IP_RETRY_SECONDS
+    
+    public_ip = ip
+    public_ip_expires = time.monotonic() + ttl
+    return public_ip
 
-def get_public_ip():
+def expire_file(file_path, token=None):
     """
-    Obtiene IP pública (simplificado - retorna localhost para desarrollo)
-    En producción, podría usar servicios externos o configuración
+    Retira archivo del servidor y lo elimina en el pool de hilos
+    
+    Args:
+        file_path: Ruta al archivo a eliminar
+        token: Token del archivo publicado (opcional)
     """
-    # Por defecto usa localhost, en producción configurar IP pública
-    return "localhost"
+    if token:
+        unpublish_file(token)
+    asyncio.get_running_loop().run_in_executor(None, cleanup_file, file_path)
 
-def schedule_cleanup(file_path, port=None, delay=FILE_RETENTION_SECONDS):
+def schedule_cleanup(file_path, token=None, delay=FILE_RETENTION_SECONDS):
     """
-    Programa limpieza de archivo y servidor después de delay segundos
+    Programa limpieza de archivo y enlace después de delay segundos
     
     Args:
         file_path: Ruta al archivo a eliminar
-        port: Puerto del servidor a detener (opcional)
+        token: Token del archivo publicado (opcional)
         delay: Segundos antes de limpiar
+    Returns:
+        TimerHandle del event loop (permite cancelar la limpieza)
     """
-    def cleanup():
-        time.sleep(delay)
-        
-        # Detener servidor si existe
-        if port:
-            stop_file_server(port)
-        
-        # Eliminar archivo
-        cleanup_file(file_path)
-    
-    thread = threading.Thread(target=cleanup, daemon=True)
-    thread.start()
+    loop = asyncio.get_running_loop()
+    return loop.call_later(delay, expire_file, file_path, token)
+
+def cleanup_served_files():
+    """Elimina al salir los archivos publicados que aún no han expirado"""
+    for entry in list(served_files.values()):
+        cleanup_file(entry["path"])
 
 # ==================== DESCARGA YT-DLP ====================
+async def drain_stream(stream, buffer):
+    """
+    Lee un stream línea a línea hasta EOF
+    
+    Args:
+        stream: StreamReader del subproceso
+        buffer: deque acotado donde guardar las líneas leídas
+    """
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            # Línea más larga que el límite del StreamReader; ya se descartó
+            continue
+        if not line:
+            break
+        buffer.append(line)
+
+def find_output_file(output_path):
+    """
+    Busca el archivo generado por yt-dlp para output_path
+    
+    Args:
+        output_path: Ruta de salida pasada a yt-dlp (sin extensión)
+    Returns:
+        Ruta del archivo más reciente (output_path o output_path.ext), o None
+    """
+    directory, prefix = os.path.split(output_path)
+    with os.scandir(directory or '.') as entries:
+        candidates = [
+            entry for entry in entries
+            if (entry.name == prefix or entry.name.startswith(prefix + '.'))
+            and not entry.name.endswith(('.part', '.ytdl'))
+            and '-Frag' not in entry.name[len(prefix):]
+            and entry.is_file()
+        ]
+    
+    if not candidates:
+        return None
+    return max(candidates, key=lambda entry: entry.stat().st_ctime).path
+
+def remove_output_files(output_path):
+    """
+    Elimina todo lo generado por yt-dlp para output_path (incluidos .part
+    y los fragmentos -FragN de --concurrent-fragments)
+    
+    Args:
+        output_path: Ruta de salida pasada a yt-dlp (sin extensión)
+    """
+    directory, prefix = os.path.split(output_path)
+    try:
+        with os.scandir(directory or '.') as entries:
+            paths = [
+                entry.path for entry in entries
+                if entry.name == prefix
+                or entry.name.startswith((prefix + '.', prefix + '-Frag'))
+            ]
+    except OSError:
+        return
+    
+    for path in paths:
+        cleanup_file(path)
+
+def kill_process_group(process):
+    """
+    Mata el proceso y sus hijos (su grupo de procesos en POSIX)
+    
+    Args:
+        process: Proceso de asyncio lanzado con start_new_session=True
+    """
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # El grupo ya terminó
+    else:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass  # El proceso ya terminó
+
 async def run_ytdlp(url, output_path):
     """
     Ejecuta yt-dlp para descargar video
@@ -176,62 +359,72 @@ async def run_ytdlp(url, output_path):
     Returns:
         (success: bool, result: str) - result es ruta del archivo o mensaje de error
     """
+    process = None
+    downloaded = None
     try:
         # Comando yt-dlp
         cmd = [
             "yt-dlp",
             "-o", output_path,
             "--no-playlist",
-            "-f", "best[filesize<50M]/best",  # Preferir archivos <50MB
+            "-f", "best[filesize<50M]/best[height<=720]/best",  # Preferir archivos <50MB
             "--max-filesize", "100M",  # Límite de seguridad
+            "--concurrent-fragments", "4",  # Fragmentos HLS/DASH en paralelo
+            "--no-part",  # Escribir directamente el archivo final
+            "--no-mtime",
             url
         ]
         
-        # Ejecutar con timeout
+        # Ejecutar con timeout (stdout solo trae progreso, se descarta).
+        # Sesión propia para poder matar también los ffmpeg que lance
         process = await asyncio.create_subprocess_exec(
             *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
         )
         
+        # Leer stderr en paralelo conservando solo las últimas líneas
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        drain_task = asyncio.create_task(drain_stream(process.stderr, stderr_tail))
+        
         try:
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=TIMEOUT_SECONDS
-            )
+            await asyncio.wait_for(process.wait(), timeout=TIMEOUT_SECONDS)
         except asyncio.TimeoutError:
-            process.kill()
-            await process.wait()
+            drain_task.cancel()
+            kill_process_group(process)
+            # Espera acotada: process.wait() no termina mientras algún
+            # proceso hijo mantenga abierto stderr
+            try:
+                await asyncio.wait_for(process.wait(), timeout=KILL_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
             return False, "TIMEOUT"
         
+        await drain_task
+        
         if process.returncode != 0:
-            error_msg = stderr.decode('utf-8', errors='ignore') if stderr else "Error desconocido"
+            error_msg = b"".join(stderr_tail).decode('utf-8', errors='ignore') or "Error desconocido"
             return False, error_msg
         
-        # Verificar que se creó el archivo
-        if os.path.exists(output_path):
-            # yt-dlp puede añadir extensión automáticamente
-            # Buscar archivo descargado
-            for ext in ['.mp4', '.webm', '.mkv', '.mov', '.avi']:
-                potential_file = output_path + ext
-                if os.path.exists(potential_file):
-                    return True, potential_file
-            
-            # Si no tiene extensión añadida, verificar el archivo exacto
-            return True, output_path
-        
-        # Buscar cualquier archivo reciente en temp
-        temp_dir = ensure_temp_dir()
-        files = os.listdir(temp_dir)
-        if files:
-            # Retornar el más reciente
-            latest = max(files, key=lambda f: os.path.getctime(os.path.join(temp_dir, f)))
-            return True, os.path.join(temp_dir, latest)
+        # yt-dlp puede añadir extensión: buscar en una sola lectura del
+        # directorio los archivos con el nombre de salida
+        downloaded = await asyncio.to_thread(find_output_file, output_path)
+        if downloaded:
+            return True, downloaded
         
         return False, "No se generó archivo"
         
     except Exception as e:
         return False, str(e)
+    finally:
+        # Cancelada (p. ej. al detener el bot) o fallida: en su propia sesión
+        # yt-dlp no recibe Ctrl+C, así que se mata antes de borrar sus archivos
+        if process is not None and process.returncode is None:
+            kill_process_group(process)
+        # No dejar archivos parciales en temp si la descarga falló
+        if downloaded is None:
+            await asyncio.to_thread(remove_output_files, output_path)
 
 # ==================== MANEJO DE MENSAJES ====================
 def extract_url(text):
@@ -243,9 +436,7 @@ def extract_url(text):
     Returns:
         URL encontrada o None
     """
-    # Patrón para detectar URLs
-    url_pattern = r'https?://[^\s<>\"{}|\\^`\\[\\]]+'
-    match = re.search(url_pattern, text)
+    match = URL_PATTERN.search(text)
     
     if match:
         return match.group(0)
@@ -259,7 +450,7 @@ async def process_download(message, url):
         message: Objeto mensaje de Discord
         url: URL a descargar
     """
-    start_time = time.time()
+    start_time = time.monotonic()
     
     # Logging de inicio
     log_data = {
@@ -269,11 +460,11 @@ async def process_download(message, url):
         "guild": str(message.guild) if message.guild else "DM",
         "url": url
     }
-    log("download_start", log_data)
+    log(MsgType.DOWNLOAD_START, log_data)
     
-    # Generar nombre de archivo único
-    timestamp = int(time.time())
-    safe_name = f"download_{timestamp}_{message.author.id}"
+    # Generar nombre de archivo único (aleatorio, sin colisiones entre
+    # descargas simultáneas)
+    safe_name = f"download_{message.author.id}_{secrets.token_hex(6)}"
     output_path = get_temp_path(safe_name)
     
     # Descargar
@@ -281,29 +472,29 @@ async def process_download(message, url):
     
     if not success:
         if result == "TIMEOUT":
-            log("timeout", None)
+            log(MsgType.TIMEOUT, None)
             await message.channel.send("❌ ERROR 101: La descarga ha tardado más de 5 minutos y ha sido cancelada.")
         else:
-            log("error", {"code": "102", "message": "No se pudo descargar", "details": result})
+            log(MsgType.ERROR, {"code": "102", "message": "No se pudo descargar", "details": result})
             await message.channel.send("❌ ERROR 102: No se pudo descargar el enlace. Puede ser inválido o estar protegido.")
         return
     
-    # Verificar archivo resultante
+    # Verificar archivo resultante y obtener tamaño (un solo stat)
     downloaded_file = result
-    if not os.path.exists(downloaded_file):
-        log("error", {"code": "102", "message": "Archivo no encontrado tras descarga"})
+    try:
+        file_size = (await asyncio.to_thread(os.stat, downloaded_file)).st_size
+    except FileNotFoundError:
+        log(MsgType.ERROR, {"code": "102", "message": "Archivo no encontrado tras descarga"})
         await message.channel.send("❌ ERROR 102: No se pudo descargar el enlace. Puede ser inválido o estar protegido.")
         return
     
-    # Obtener tamaño
-    file_size = os.path.getsize(downloaded_file)
-    duration = time.time() - start_time
+    duration = time.monotonic() - start_time
     
     # Logging de éxito
-    log("download_success", {
+    log(MsgType.DOWNLOAD_SUCCESS, {
         "filename": os.path.basename(downloaded_file),
         "size_formatted": format_size(file_size),
-        "duration": duration
+        "duration_formatted": f"{duration:.2f}s"
     })
     
     # Decidir si adjuntar o servir online
@@ -312,7 +503,7 @@ async def process_download(message, url):
         await send_as_attachment(message, downloaded_file)
     else:
         # Publicar online
-        await serve_online(message, downloaded_file)
+        await serve_online(message, downloaded_file, file_size)
 
 async def send_as_attachment(message, file_path):
     """
@@ -325,56 +516,47 @@ async def send_as_attachment(message, file_path):
     try:
         filename = os.path.basename(file_path)
         
-        log("attachment_sent", {"filename": filename})
+        log(MsgType.ATTACHMENT_SENT, {"filename": filename})
         
-        # Enviar mensaje con archivo
-        with open(file_path, 'rb') as f:
-            discord_file = discord.File(f, filename=filename)
-            await message.channel.send("✅ Listo — aquí tienes tu archivo.", file=discord_file)
+        # Enviar mensaje con archivo (discord.py lo abre, lo envía en
+        # streaming y lo cierra tras el envío)
+        discord_file = discord.File(file_path, filename=filename)
+        await message.channel.send("✅ Listo — aquí tienes tu archivo.", file=discord_file)
         
         # Limpiar archivo inmediatamente
-        cleanup_file(file_path)
+        await asyncio.to_thread(cleanup_file, file_path, filename)
         
     except Exception as e:
-        log("error", {"code": "110", "message": "Error al enviar adjunto", "details": str(e)})
+        log(MsgType.ERROR, {"code": "110", "message": "Error al enviar adjunto", "details": str(e)})
         await message.channel.send("❌ ERROR 110: Error interno al enviar el archivo.")
-        cleanup_file(file_path)
+        await asyncio.to_thread(cleanup_file, file_path)
 
-async def serve_online(message, file_path):
+async def serve_online(message, file_path, file_size):
     """
     Publica archivo en servidor HTTP temporal
     
     Args:
         message: Objeto mensaje
         file_path: Ruta al archivo
+        file_size: Tamaño del archivo en bytes
     """
+    token = None
     try:
         filename = os.path.basename(file_path)
         
-        # Determinar puerto
-        port_config = os.getenv('SERVE_PORT', 'auto')
-        if port_config.lower() == 'auto':
-            port = random.randint(8000, 8999)
-        else:
-            port = int(port_config)
-        
-        # Intentar iniciar servidor (con reintentos si el puerto está ocupado)
-        max_attempts = 10
-        for attempt in range(max_attempts):
-            if start_file_server(file_path, port):
-                break
-            port = random.randint(8000, 8999)
-        else:
-            log("error", {"code": "103", "message": "No se pudo iniciar servidor después de varios intentos"})
+        if file_runner is None:
+            log(MsgType.ERROR, {"code": "103", "message": "Servidor de archivos no disponible"})
             await message.channel.send("❌ ERROR 103: No se pudo publicar el archivo online.")
-            cleanup_file(file_path)
+            await asyncio.to_thread(cleanup_file, file_path, filename)
             return
         
+        token = publish_file(file_path, file_size)
+        
         # Generar URL
-        ip = get_public_ip()
-        url = f"http://{ip}:{port}/{filename}"
+        ip = await get_public_ip()
+        url = f"http://{ip}:{server_port}/{token}/{filename}"
         
-        log("serving_file", {
+        log(MsgType.SERVING_FILE, {
             "filename": filename,
             "url": url,
             "expires": FILE_RETENTION_SECONDS
@@ -386,21 +568,28 @@ async def serve_online(message, file_path):
             f"🔗 Enlace temporal (expira en 1 hora): {url}"
         )
         
-        # Programar limpieza
-        schedule_cleanup(file_path, port, FILE_RETENTION_SECONDS)
-        
     except Exception as e:
-        log("error", {"code": "103", "message": "Error al publicar online", "details": str(e)})
+        log(MsgType.ERROR, {"code": "103", "message": "Error al publicar online", "details": str(e)})
         await message.channel.send("❌ ERROR 103: No se pudo publicar el archivo online.")
-        cleanup_file(file_path)
+        expire_file(file_path, token)
 
 # ==================== EVENTOS DISCORD ====================
 @client.event
 async def on_ready():
     """Evento cuando el bot está listo"""
+    global http_session
+    
     print(f"🤖 Bot conectado como {client.user}")
     print(f"📊 Latencia: {round(client.latency * 1000)}ms")
     print("=" * 50)
+    
+    # on_ready se repite en cada reconexión; el servidor se inicia una vez
+    if file_runner is None and await start_file_server():
+        print(f"🌐 Servidor de archivos en puerto {server_port}")
+    
+    # Sesión HTTP reutilizada durante toda la vida del bot
+    if http_session is None:
+        http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
 
 @client.event
 async def on_message(message):
@@ -421,20 +610,53 @@ async def on_message(message):
     if not url:
         return  # No hay enlace, ignorar
     
-    # Verificar si el bot está ocupado
-    if download_lock.locked():
+    # Verificar si el bot está ocupado (sin huecos libres o el usuario ya
+    # tiene una descarga en curso)
+    user_id = message.author.id
+    if download_sem.locked() or user_id in active_users:
         # Notificar en DM que está ocupado
         if isinstance(message.channel, discord.DMChannel):
             await message.channel.send("🔒 ERROR 100: Bot ocupado, intenta más tarde.")
-        log("busy", None)
+        log(MsgType.BUSY, None)
         return
     
-    # Procesar descarga con lock
-    async with download_lock:
-        await process_download(message, url)
+    # Procesar descarga ocupando un hueco del semáforo
+    active_users.add(user_id)
+    try:
+        async with download_sem:
+            await process_download(message, url)
+    finally:
+        active_users.discard(user_id)
 
 
 # ==================== INICIO ====================
+async def run_bot(token):
+    """
+    Ejecuta el bot y libera los recursos asíncronos al terminar
+    
+    Args:
+        token: Token de Discord
+    """
+    global download_sem
+    
+    # Creado aquí para quedar ligado a este event loop (Python 3.9)
+    download_sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    
+    # Pool acotado para asyncio.to_thread / run_in_executor
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=DISK_WORKERS, thread_name_prefix='disk')
+    )
+    
+    try:
+        async with client:
+            await client.start(token)
+    finally:
+        if http_session is not None:
+            await http_session.close()
+        if file_runner is not None:
+            await file_runner.cleanup()
+            log(MsgType.SERVER_SHUTDOWN, {"port": server_port})
+
 def main():
     """Función principal"""
     # Verificar token
@@ -456,10 +678,16 @@ def main():
     # Crear directorio temp
     ensure_temp_dir()
     
+    # Los temporizadores de limpieza no se ejecutan si el bot se detiene
+    atexit.register(cleanup_served_files)
+    
     # Iniciar bot
     print("🚀 Iniciando bot...")
+    discord.utils.setup_logging()
     try:
-        client.run(token)
+        asyncio.run(run_bot(token))
+    except KeyboardInterrupt:
+        print("\n👋 Bot detenido")
     except discord.LoginFailure:
         print("❌ ERROR: Token de Discord inválido")
     except Exception as e:
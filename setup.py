@@ -88,7 +88,7 @@ def get_venv_pip():
         return ".venv/bin/pip"
 
 def install_dependencies():
-    """Instala dependencias una a una"""
+    """Instala todas las dependencias en una sola invocación de pip"""
     dependencies = [
         "colorama",
         "python-dotenv",
@@ -100,14 +100,17 @@ def install_dependencies():
     
     for package in dependencies:
         print_installing(package)
-        try:
-            cmd = f'"{pip}" install {package} -q'
-            run_command(cmd)
-            print_installed(package)
-        except subprocess.CalledProcessError as e:
-            print_error(f"No se pudo instalar {package}")
-            print(f"{RED}{e}{RESET}")
-            return False
+    
+    try:
+        cmd = f'"{pip}" install {" ".join(dependencies)} -q'
+        run_command(cmd)
+    except subprocess.CalledProcessError as e:
+        print_error(f"No se pudieron instalar las dependencias: {', '.join(dependencies)}")
+        print(f"{RED}{e.stderr or e}{RESET}")
+        return False
+    
+    for package in dependencies:
+        print_installed(package)
     
     return True
 
@@ -130,7 +133,7 @@ def setup_env():
     print("  1. http (servidor HTTP local - recomendado)")
     serve_mode = "http"
     
-    port_choice = input(f"{CYAN}📡 Puerto (auto para aleatorio 8000-8999, o número específico): {RESET}").strip()
+    port_choice = input(f"{CYAN}📡 Puerto (auto para uno libre asignado por el sistema, o número específico): {RESET}").strip()
     serve_port = port_choice if port_choice else "auto"
     
     env_content = f"""DISCORD_TOKEN={token}
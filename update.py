@@ -34,65 +34,59 @@ def run_command(cmd, capture=True):
     except Exception as e:
         return -1, "", str(e)
 
-def get_local_commit():
+def fetch_remote():
     """
-    Obtiene el hash del commit local actual
+    Descarga la información del remoto sin fusionar
     
     Returns:
-        Hash del commit o None si hay error
+        True si fue exitoso, False si falló
     """
-    code, stdout, stderr = run_command(["git", "rev-parse", "HEAD"])
-    if code == 0:
-        return stdout.strip()
-    return None
+    code, _, stderr = run_command(["git", "fetch", "origin"])
+    if code != 0:
+        print(f"⚠️  Error al obtener información remota: {stderr}")
+        return False
+    return True
 
-def get_remote_commit():
+def get_divergence():
     """
-    Obtiene el hash del último commit en el remoto
+    Compara HEAD con la rama remota en una sola llamada a git
     
     Returns:
-        Hash del commit o None si hay error
+        (ahead, behind, remote_ref) o None si hay error
     """
-    # Fetch latest info from remote without merging
-    code, _, stderr = run_command(["git", "fetch", "origin"])
-    if code != 0:
-        print(f"⚠️  Error al obtener información remota: {stderr}")
-        return None
-    
-    # Get remote HEAD commit
-    code, stdout, stderr = run_command(["git", "rev-parse", "origin/master"])
-    if code == 0:
-        return stdout.strip()
-    
-    # Try main branch if master doesn't exist
-    code, stdout, stderr = run_command(["git", "rev-parse", "origin/main"])
-    if code == 0:
-        return stdout.strip()
-    
+    # Rama upstream configurada; si no existe, probar master y main
+    for ref in ("@{u}", "origin/master", "origin/main"):
+        code, stdout, _ = run_command([
+            "git", "rev-list", "--left-right", "--count", f"HEAD...{ref}"
+        ])
+        if code == 0:
+            ahead, behind = map(int, stdout.split())
+            return ahead, behind, ref
     return None
 
-def get_commit_info(commit_hash):
+def get_commits_info(*refs):
     """
-    Obtiene información legible de un commit
+    Obtiene información legible de varios commits en una sola llamada
     
     Args:
-        commit_hash: Hash del commit
+        refs: Referencias de los commits (distintos entre sí)
     Returns:
-        String con info del commit
+        Lista con la info de cada commit, en el mismo orden
     """
     code, stdout, _ = run_command([
-        "git", "log", "-1", "--pretty=format:%h - %s (%cr)", commit_hash
+        "git", "log", "--no-walk=unsorted", "--pretty=format:%h - %s (%cr)", *refs
     ])
-    if code == 0:
-        return stdout.strip()
-    return commit_hash[:7]
+    lines = stdout.strip().splitlines()
+    if code == 0 and len(lines) == len(refs):
+        return lines
+    return list(refs)
 
 def check_updates():
     """
     Verifica si hay actualizaciones disponibles
     
     Returns:
-        (needs_update: bool, local_commit: str, remote_commit: str)
+        (needs_update: bool, local_info: str, remote_info: str)
     """
     print("🔍 Verificando actualizaciones...")
     
@@ -102,22 +96,25 @@ def check_updates():
         print("❌ Error: No se encuentra un repositorio git válido")
         return False, None, None
     
-    local = get_local_commit()
-    remote = get_remote_commit()
-    
-    if not local:
-        print("❌ Error: No se pudo obtener la versión local")
-        return False, None, None
-    
-    if not remote:
+    divergence = get_divergence() if fetch_remote() else None
+    if divergence is None:
         print("❌ Error: No se pudo obtener la versión remota")
         return False, None, None
     
-    print(f"📦 Versión local:  {get_commit_info(local)}")
-    print(f"🌐 Versión remota: {get_commit_info(remote)}")
+    ahead, behind, remote_ref = divergence
+    
+    # Si no hay diferencias ambas referencias apuntan al mismo commit
+    if ahead == 0 and behind == 0:
+        local_info = remote_info = get_commits_info("HEAD")[0]
+    else:
+        local_info, remote_info = get_commits_info("HEAD", remote_ref)
+    
+    print(f"📦 Versión local:  {local_info}")
+    print(f"🌐 Versión remota: {remote_info}")
+    if ahead:
+        print(f"ℹ️  Tienes {ahead} commit(s) locales que no están en el remoto")
     
-    needs_update = local != remote
-    return needs_update, local, remote
+    return behind > 0, local_info, remote_info
 
 def perform_update():
     """
@@ -3,9 +3,14 @@ Utilidades para Discord Video Bot
 Funciones de logging y manejo de archivos
 """
 
+import atexit
 import json
 import os
-from datetime import datetime
+import sys
+import threading
+import time
+from collections import deque
+from enum import IntEnum
 from pathlib import Path
 
 # Intentar importar colorama, si no está disponible usar strings vacíos
@@ -21,115 +26,265 @@ try:
 except ImportError:
     YELLOW = GREEN = RED = CYAN = MAGENTA = RESET = ""
 
+# Sin colores si la salida no es una terminal (archivo, pipe, servicio)
+if sys.stdout is None or not sys.stdout.isatty():
+    YELLOW = GREEN = RED = CYAN = MAGENTA = RESET = ""
+
+# ==================== SALIDA BUFFERIZADA ====================
+LOG_FLUSH_INTERVAL = 0.1  # Segundos entre volcados a stdout
+LOG_FLUSH_LINES = 256  # Líneas acumuladas que fuerzan un volcado inmediato
+LOG_BUFFER_LINES = 10_000  # Máximo de líneas pendientes (se pierden las más antiguas)
+
+_log_buffer = deque(maxlen=LOG_BUFFER_LINES)
+_flush_lock = threading.Lock()
+_flush_event = threading.Event()
+_flush_thread = None  # Hilo "log-flush", se inicia con la primera línea
+_flush_failed = False  # True tras informar de un error de escritura
+
+def _start_flush_thread():
+    """Inicia el hilo de volcado (una sola vez) y el volcado final al salir"""
+    global _flush_thread
+    with _flush_lock:
+        if _flush_thread is None:
+            thread = threading.Thread(target=_flush_loop, name="log-flush", daemon=True)
+            try:
+                thread.start()
+            except RuntimeError:
+                return  # Intérprete cerrándose: quien emite vuelca con flush_log()
+            _flush_thread = thread
+            atexit.register(flush_log)
+
+def _emit(line):
+    """Añade una línea al buffer de salida (la escribe el hilo de volcado)"""
+    if _flush_thread is None:
+        _start_flush_thread()
+    _log_buffer.append(line)
+    if len(_log_buffer) >= LOG_FLUSH_LINES:
+        _flush_event.set()
+
+def _write_stdout(text):
+    """Escribe en stdout sustituyendo lo que su codificación no admita"""
+    try:
+        sys.stdout.write(text)
+    except UnicodeEncodeError:
+        # Salida redirigida sin UTF-8 (p. ej. cp1252 en Windows): sin emojis
+        encoding = sys.stdout.encoding or "ascii"
+        sys.stdout.write(text.encode(encoding, "replace").decode(encoding))
+    sys.stdout.flush()
+
+def flush_log():
+    """Escribe en stdout, en una sola llamada, todo lo acumulado en el buffer"""
+    global _flush_failed
+    with _flush_lock:
+        lines = []
+        while _log_buffer:
+            lines.append(_log_buffer.popleft())
+        if not lines or sys.stdout is None:
+            return
+        try:
+            _write_stdout("\n".join(lines) + "\n")
+        except Exception as e:
+            # Se descarta el lote; el hilo de volcado sigue funcionando
+            if not _flush_failed:
+                _flush_failed = True
+                try:
+                    sys.stderr.write(f"Error al escribir log: {e!r}\n")
+                except Exception:
+                    pass
+
+def _flush_loop():
+    """Vuelca el buffer cada LOG_FLUSH_INTERVAL o cuando se llena"""
+    while True:
+        _flush_event.wait(LOG_FLUSH_INTERVAL)
+        _flush_event.clear()
+        flush_log()
+
+# ==================== CONFIGURACIÓN ====================
+class MsgType(IntEnum):
+    """Tipos de mensaje de log (el valor indexa las tablas de cada modo)"""
+    DOWNLOAD_START = 0
+    DOWNLOAD_SUCCESS = 1
+    ATTACHMENT_SENT = 2
+    SERVING_FILE = 3
+    ERROR = 4
+    TIMEOUT = 5
+    BUSY = 6
+    CLEANUP = 7
+    SERVER_SHUTDOWN = 8
+
+# Nombres usados en config.json y por llamadas antiguas con strings
+MSG_TYPE_NAMES = tuple(msg_type.name.lower() for msg_type in MsgType)
+_MSG_TYPES_BY_NAME = dict(zip(MSG_TYPE_NAMES, MsgType))
+
+# Tipos activos, indexado por MsgType (por defecto todos)
+_ALL_ENABLED = (True,) * len(MsgType)
+
+# Caché de config.json: se vuelve a leer solo si cambia su mtime
+_config_cache = {"mtime": None, "data": None, "enabled_types": _ALL_ENABLED}
+
 def load_config():
-    """Carga configuración desde config.json"""
+    """Carga configuración desde config.json (cacheada mientras no cambie)"""
     try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"log_mode": "detailed"}
+        mtime = os.stat("config.json").st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    
+    if _config_cache["data"] is None or mtime != _config_cache["mtime"]:
+        data = {"log_mode": "detailed"}
+        if mtime is not None:
+            try:
+                data = json.loads(Path("config.json").read_bytes())
+            except (FileNotFoundError, UnicodeDecodeError, json.JSONDecodeError):
+                pass
+            if not isinstance(data, dict):
+                data = {"log_mode": "detailed"}
+        _config_cache["mtime"] = mtime
+        _config_cache["data"] = data
+        # Solo se acepta una lista de nombres; cualquier otro valor habilita todos los tipos
+        enabled_names = data.get("enabled_types")
+        if isinstance(enabled_names, (list, tuple)):
+            names = {name for name in enabled_names if isinstance(name, str)}
+            _config_cache["enabled_types"] = tuple(name in names for name in MSG_TYPE_NAMES)
+        else:
+            _config_cache["enabled_types"] = _ALL_ENABLED
+    
+    return _config_cache["data"]
 
 def get_timestamp():
-    """Obtiene timestamp actual formateado"""
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    """Obtiene timestamp actual formateado (YYYY-MM-DD HH:MM:SS)"""
+    t = time.localtime()
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
+# Cabeceras de log detallado con color y emoji ya resueltos; solo quedan
+# los huecos %s del timestamp (y del código en errores)
+_DETAILED_HEADERS = {
+    MsgType.DOWNLOAD_START: f"{CYAN}[%s] 📥 INICIANDO DESCARGA{RESET}\n",
+    MsgType.DOWNLOAD_SUCCESS: f"{GREEN}[%s] ✅ DESCARGA COMPLETADA{RESET}\n",
+    MsgType.ATTACHMENT_SENT: f"{GREEN}[%s] 📎 ENVIADO COMO ADJUNTO{RESET}\n",
+    MsgType.SERVING_FILE: f"{MAGENTA}[%s] 🌐 PUBLICADO ONLINE{RESET}\n",
+    MsgType.ERROR: f"{RED}[%s] ❌ ERROR %s{RESET}\n",
+    MsgType.TIMEOUT: f"{RED}[%s] ⏱️  TIMEOUT{RESET}\n",
+    MsgType.BUSY: f"{YELLOW}[%s] 🔒 BOT OCUPADO{RESET}\n",
+    MsgType.CLEANUP: f"{YELLOW}[%s] 🧹 LIMPIEZA{RESET}\n",
+    MsgType.SERVER_SHUTDOWN: f"{MAGENTA}[%s] 🔌 SERVIDOR APAGADO{RESET}\n"
+}
+
+def _detailed_download_start(timestamp, data):
+    get = data.get
+    _emit(
+        _DETAILED_HEADERS[MsgType.DOWNLOAD_START] % timestamp +
+        f"  👤 Usuario: {get('username')} (ID: {get('user_id')})\n"
+        f"  💬 Canal: {get('channel')}\n"
+        f"  🏠 Servidor: {get('guild')}\n"
+        f"  🔗 Enlace: {get('url')}"
+    )
+
+def _detailed_download_success(timestamp, data):
+    get = data.get
+    _emit(
+        _DETAILED_HEADERS[MsgType.DOWNLOAD_SUCCESS] % timestamp +
+        f"  📁 Archivo: {get('filename')}\n"
+        f"  📊 Tamaño: {get('size_formatted')}\n"
+        f"  ⏱️  Duración: {get('duration_formatted')}"
+    )
+
+def _detailed_attachment_sent(timestamp, data):
+    _emit(_DETAILED_HEADERS[MsgType.ATTACHMENT_SENT] % timestamp + f"  📁 Archivo: {data.get('filename')}")
+
+def _detailed_serving_file(timestamp, data):
+    get = data.get
+    _emit(
+        _DETAILED_HEADERS[MsgType.SERVING_FILE] % timestamp +
+        f"  📁 Archivo: {get('filename')}\n"
+        f"  🔗 URL: {get('url')}\n"
+        f"  ⏰ Expira en: {get('expires')}s"
+    )
+
+def _detailed_error(timestamp, data):
+    get = data.get
+    text = _DETAILED_HEADERS[MsgType.ERROR] % (timestamp, get('code')) + f"  📝 Mensaje: {get('message')}"
+    details = get('details')
+    if details:
+        text += f"\n  🔍 Detalles: {details}"
+    _emit(text)
+
+def _detailed_timeout(timestamp, data):
+    _emit(_DETAILED_HEADERS[MsgType.TIMEOUT] % timestamp + "  📝 La descarga excedió el tiempo límite")
+
+def _detailed_busy(timestamp, data):
+    _emit(_DETAILED_HEADERS[MsgType.BUSY] % timestamp + "  ⏭️  Mensaje ignorado - descarga en progreso")
+
+def _detailed_cleanup(timestamp, data):
+    _emit(_DETAILED_HEADERS[MsgType.CLEANUP] % timestamp + f"  🗑️  Archivo eliminado: {data.get('filename')}")
+
+def _detailed_server_shutdown(timestamp, data):
+    _emit(_DETAILED_HEADERS[MsgType.SERVER_SHUTDOWN] % timestamp + f"  🌐 Puerto: {data.get('port')}")
+
+# Handler de log detallado, indexado por MsgType
+_DETAILED_HANDLERS = (
+    _detailed_download_start,
+    _detailed_download_success,
+    _detailed_attachment_sent,
+    _detailed_serving_file,
+    _detailed_error,
+    _detailed_timeout,
+    _detailed_busy,
+    _detailed_cleanup,
+    _detailed_server_shutdown
+)
 
 def log_detailed(message_type, data):
     """
     Logging detallado con toda la información
     
     Args:
-        message_type: Tipo de mensaje (download, success, error, etc.)
+        message_type: Tipo de mensaje (MsgType)
         data: Diccionario con datos del mensaje
     """
-    timestamp = get_timestamp()
-    
-    if message_type == "download_start":
-        print(f"{CYAN}[{timestamp}] 📥 INICIANDO DESCARGA{RESET}")
-        print(f"  👤 Usuario: {data.get('username')} (ID: {data.get('user_id')})")
-        print(f"  💬 Canal: {data.get('channel')}")
-        print(f"  🏠 Servidor: {data.get('guild')}")
-        print(f"  🔗 Enlace: {data.get('url')}")
-        
-    elif message_type == "download_success":
-        print(f"{GREEN}[{timestamp}] ✅ DESCARGA COMPLETADA{RESET}")
-        print(f"  📁 Archivo: {data.get('filename')}")
-        print(f"  📊 Tamaño: {data.get('size_formatted')}")
-        print(f"  ⏱️  Duración: {data.get('duration'):.2f}s")
-        
-    elif message_type == "attachment_sent":
-        print(f"{GREEN}[{timestamp}] 📎 ENVIADO COMO ADJUNTO{RESET}")
-        print(f"  📁 Archivo: {data.get('filename')}")
-        
-    elif message_type == "serving_file":
-        print(f"{MAGENTA}[{timestamp}] 🌐 PUBLICADO ONLINE{RESET}")
-        print(f"  📁 Archivo: {data.get('filename')}")
-        print(f"  🔗 URL: {data.get('url')}")
-        print(f"  ⏰ Expira en: {data.get('expires')}s")
-        
-    elif message_type == "error":
-        print(f"{RED}[{timestamp}] ❌ ERROR {data.get('code')}{RESET}")
-        print(f"  📝 Mensaje: {data.get('message')}")
-        if data.get('details'):
-            print(f"  🔍 Detalles: {data.get('details')}")
-            
-    elif message_type == "timeout":
-        print(f"{RED}[{timestamp}] ⏱️  TIMEOUT{RESET}")
-        print(f"  📝 La descarga excedió el tiempo límite")
-        
-    elif message_type == "busy":
-        print(f"{YELLOW}[{timestamp}] 🔒 BOT OCUPADO{RESET}")
-        print(f"  ⏭️  Mensaje ignorado - descarga en progreso")
-        
-    elif message_type == "cleanup":
-        print(f"{YELLOW}[{timestamp}] 🧹 LIMPIEZA{RESET}")
-        print(f"  🗑️  Archivo eliminado: {data.get('filename')}")
-        
-    elif message_type == "server_shutdown":
-        print(f"{MAGENTA}[{timestamp}] 🔌 SERVIDOR APAGADO{RESET}")
-        print(f"  🌐 Puerto: {data.get('port')}")
+    _DETAILED_HANDLERS[message_type](get_timestamp(), data)
+
+# Icono de log minimal, indexado por MsgType
+_MINIMAL_ICONS = ("📥", "✅", "📎", "🌐", "❌", "⏱️", "🔒", "🧹", "🔌")
 
 def log_minimal(message_type, data=None):
     """
     Logging minimal - solo uso básico y hora
     
     Args:
-        message_type: Tipo de mensaje
+        message_type: Tipo de mensaje (MsgType)
         data: Datos opcionales
     """
     timestamp = get_timestamp()
+    icon = _MINIMAL_ICONS[message_type]
     
-    icons = {
-        "download_start": "📥",
-        "download_success": "✅",
-        "attachment_sent": "📎",
-        "serving_file": "🌐",
-        "error": "❌",
-        "timeout": "⏱️",
-        "busy": "🔒",
-        "cleanup": "🧹",
-        "server_shutdown": "🔌"
-    }
-    
-    icon = icons.get(message_type, "ℹ️")
-    
-    if message_type == "error":
-        print(f"{RED}[{timestamp}] {icon} ERROR {data.get('code') if data else ''}{RESET}")
-    elif message_type == "download_success":
-        print(f"{GREEN}[{timestamp}] {icon} Descarga OK{RESET}")
-    elif message_type == "serving_file":
-        print(f"{MAGENTA}[{timestamp}] {icon} Online: {data.get('url') if data else ''}{RESET}")
+    if message_type is MsgType.ERROR:
+        _emit(f"{RED}[{timestamp}] {icon} ERROR {data.get('code') if data else ''}{RESET}")
+    elif message_type is MsgType.DOWNLOAD_SUCCESS:
+        _emit(f"{GREEN}[{timestamp}] {icon} Descarga OK{RESET}")
+    elif message_type is MsgType.SERVING_FILE:
+        _emit(f"{MAGENTA}[{timestamp}] {icon} Online: {data.get('url') if data else ''}{RESET}")
     else:
-        print(f"{CYAN}[{timestamp}] {icon} {message_type}{RESET}")
+        _emit(f"{CYAN}[{timestamp}] {icon} {MSG_TYPE_NAMES[message_type]}{RESET}")
 
 def log(message_type, data=None):
     """
     Función principal de logging que selecciona el modo
     
     Args:
-        message_type: Tipo de mensaje
+        message_type: Tipo de mensaje (MsgType o su nombre en minúsculas)
         data: Diccionario con datos adicionales
     """
+    if isinstance(message_type, str):
+        message_type = _MSG_TYPES_BY_NAME.get(message_type)
+        if message_type is None:
+            return
+    
     config = load_config()
+    
+    # Descartar tipos desactivados antes de formatear nada
+    if not _config_cache["enabled_types"][message_type]:
+        return
+    
     mode = config.get("log_mode", "detailed")
     
     if mode == "minimal":
@@ -137,6 +292,45 @@ def log(message_type, data=None):
     else:
         log_detailed(message_type, data)
 
+# ==================== PERFILADO ====================
+# BOT_PROF=1 mide cada llamada a log() y muestra percentiles al salir
+PROFILE_LOG = os.getenv("BOT_PROF") == "1"
+_log_samples = []  # Duraciones de log() en nanosegundos
+
+def _report_log_samples():
+    """Muestra percentiles de duración de log() (solo con BOT_PROF=1)"""
+    if not _log_samples:
+        return
+    
+    samples = sorted(_log_samples)
+    count = len(samples)
+    
+    def percentile(p):
+        return samples[min(count - 1, count * p // 100)] / 1000
+    
+    _emit(
+        f"{CYAN}📈 PERFIL log(): {count} llamadas{RESET}\n"
+        f"  p50: {percentile(50):.1f}µs | p90: {percentile(90):.1f}µs | "
+        f"p99: {percentile(99):.1f}µs | máx: {samples[-1] / 1000:.1f}µs"
+    )
+    flush_log()
+
+if PROFILE_LOG:
+    _log_unprofiled = log
+    
+    def log(message_type, data=None):
+        """log() con medición de tiempo (BOT_PROF=1)"""
+        start = time.perf_counter_ns()
+        try:
+            _log_unprofiled(message_type, data)
+        finally:
+            _log_samples.append(time.perf_counter_ns() - start)
+    
+    atexit.register(_report_log_samples)
+
+# Unidades de tamaño (nombre, desplazamiento en bits)
+_SIZE_UNITS = (("B", 0), ("KB", 10), ("MB", 20), ("GB", 30))
+
 def format_size(size_bytes):
     """
     Formata tamaño en bytes a formato legible
@@ -146,44 +340,55 @@ def format_size(size_bytes):
     Returns:
         String formateado (ej: "14.5 MB")
     """
-    if size_bytes < 1024:
+    # Cada unidad son 10 bits: bit_length elige la unidad sin comparaciones
+    index = min(max(0, (size_bytes.bit_length() - 1) // 10), len(_SIZE_UNITS) - 1)
+    name, shift = _SIZE_UNITS[index]
+    if shift == 0:
         return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    else:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
+    return f"{size_bytes / (1 << shift):.1f} {name}"
 
-def cleanup_file(filepath):
+def cleanup_file(filepath, filename=None):
     """
     Elimina archivo si existe
     
     Args:
         filepath: Ruta al archivo
+        filename: Nombre del archivo para el log (opcional, se deduce de filepath)
+    Returns:
+        True si se eliminó, False si no existía o hubo error
     """
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            log("cleanup", {"filename": os.path.basename(filepath)})
-            return True
-    except Exception as e:
-        print(f"{RED}Error al eliminar archivo: {e}{RESET}")
-    return False
+        os.unlink(filepath)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        _emit(f"{RED}Error al eliminar archivo: {e}{RESET}")
+        return False
+    
+    log(MsgType.CLEANUP, {"filename": filename or filepath.rpartition(os.sep)[2]})
+    return True
+
+TEMP_DIR = "temp"
+_TEMP_PATH = Path(TEMP_DIR)
+_TEMP_PREFIX = TEMP_DIR + os.sep
+_temp_ready = False  # True cuando ya se comprobó/creó TEMP_DIR
 
 def ensure_temp_dir():
-    """Asegura que existe el directorio temp"""
-    temp_path = Path("temp")
-    if not temp_path.exists():
-        temp_path.mkdir()
-    return str(temp_path)
+    """Asegura que existe el directorio temp (solo toca disco la primera vez)"""
+    global _temp_ready
+    if not _temp_ready:
+        _TEMP_PATH.mkdir(parents=True, exist_ok=True)
+        _temp_ready = True
+    return TEMP_DIR
 
 def get_temp_path(filename):
     """
     Obtiene ruta completa en directorio temp
+    El directorio lo crea ensure_temp_dir() al arrancar el bot
     
     Args:
         filename: Nombre del archivo
     Returns:
         Ruta completa
     """
-    temp_dir = ensure_temp_dir()
-    return os.path.join(temp_dir, filename)
+    return _TEMP_PREFIX + filename